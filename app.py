@@ -1,44 +1,430 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+from werkzeug.exceptions import BadRequest
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from base64 import b64encode, b64decode
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+from pybase64 import b64encode_as_string, b64decode  # SIMD-accelerated drop-in for base64
+import apsw
+import binascii
+import contextlib
+import functools
+import orjson
 import os
-import sqlite3
+import redis
+import threading
 
 # Flask app setup
 app = Flask(__name__)
 DB_FILE = 'services.db'
 
+# Number of prepared statements kept per connection (LRU keyed by SQL text)
+STATEMENT_CACHE_SIZE = 64
+
+# Range of SQLite's signed 64-bit INTEGER
+SQLITE_INT_MIN = -2 ** 63
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+# How long to wait for a lock held by another connection
+BUSY_TIMEOUT_MS = 5000
+
+# Memory-mapped I/O window per connection (256 MiB)
+MMAP_SIZE = 268435456
+
+# Per-thread database connection and random IV pool, reused across requests
+_local = threading.local()
+
+# Size of the per-thread buffer IVs and nonces are sliced from
+RANDOM_POOL_SIZE = 4096
+
+# Number of (service, key version) entries kept in the decoded key cache
+KEY_CACHE_SIZE = 1024
+
+# Optional Redis cache shared by all workers, checked when the in-process
+# key cache misses. Enabled by setting REDIS_URL (e.g. redis://localhost:6379/0).
+REDIS_URL = os.environ.get('REDIS_URL')
+REDIS_KEY_TTL = 3600  # seconds
+# Without timeouts redis-py blocks forever on an unresponsive server
+REDIS_TIMEOUT = 0.2  # seconds
+_redis = redis.Redis.from_url(
+    REDIS_URL,
+    socket_timeout=REDIS_TIMEOUT,
+    socket_connect_timeout=REDIS_TIMEOUT,
+) if REDIS_URL else None
+
+# Cipher modes, stored per key version.
+# GCM is used for random-IV keys; fixed-IV keys stay on CFB because GCM must
+# never reuse a nonce. Key versions created before GCM support are CFB.
+CIPHER_MODE_CFB = 'CFB'
+CIPHER_MODE_GCM = 'GCM'
+GCM_NONCE_SIZE = 12  # 96-bit nonce recommended for GCM
+GCM_TAG_SIZE = 16  # bytes
+AES_BLOCK_SIZE = 16  # bytes
+
 # Utility functions
+class _RandomPool:
+    """
+    Buffer of random bytes filled by a single os.urandom call.
+    IVs and nonces are sliced from it, so most of them cost no syscall.
+    Each thread has its own pool (see _random_bytes).
+    """
+
+    def __init__(self, size=RANDOM_POOL_SIZE):
+        self.size = size
+        self.buf = b''
+        self.offset = 0
+
+    def get(self, n):
+        """Return n fresh random bytes, refilling the buffer when exhausted."""
+        if self.offset + n > len(self.buf):
+            self.buf = os.urandom(self.size)
+            self.offset = 0
+        data = self.buf[self.offset:self.offset + n]
+        self.offset += n
+        return data
+
+def _random_bytes(n):
+    """Return n random bytes from the current thread's pool."""
+    pool = getattr(_local, 'random_pool', None)
+    if pool is None:
+        pool = _local.random_pool = _RandomPool()
+    return pool.get(n)
+
+def _reset_after_fork():
+    """
+    Drop per-thread state in a forked child.
+    Otherwise parent and child would hand out the same pooled IVs and share
+    a SQLite connection.
+    """
+    global _local
+    _local = threading.local()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
 def generate_aes_key():
     """Generate a random AES-256 key."""
     return os.urandom(32)  # 32 bytes = 256 bits
 
 def generate_iv():
     """Generate a random Initialization Vector (IV)."""
-    return os.urandom(16)  # 16 bytes for AES block size
+    return _random_bytes(16)  # 16 bytes for AES block size
+
+def generate_nonce():
+    """Generate a random nonce for AES-GCM."""
+    return _random_bytes(GCM_NONCE_SIZE)
+
+def cipher_mode_for(use_fixed_iv):
+    """Return the cipher mode to use for a new key version."""
+    return CIPHER_MODE_CFB if use_fixed_iv else CIPHER_MODE_GCM
+
+def get_conn():
+    """
+    Return the database connection for the current thread.
+    The connection is opened once per thread and kept open, so the prepared
+    statements in its statement cache are reused by subsequent requests.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # apsw connections autocommit; each statement is its own transaction
+        conn = apsw.Connection(DB_FILE, statementcachesize=STATEMENT_CACHE_SIZE)
+        conn.setbusytimeout(BUSY_TIMEOUT_MS)
+        # journal_mode=WAL is persistent and set by initialize_database().
+        # Under WAL, NORMAL only syncs at checkpoints and stays crash-safe.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        _local.conn = conn
+    return conn
+
+@contextlib.contextmanager
+def write_transaction(conn):
+    """
+    Run the enclosed statements in one write transaction.
+    BEGIN IMMEDIATE takes the write lock up front, so a transaction that
+    reads before it writes cannot fail with SQLITE_BUSY halfway through.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        # Also covers a failed COMMIT, so the transaction never stays open on
+        # the long-lived per-thread connection. SQLite may already have rolled
+        # back on its own (e.g. after an I/O error).
+        if not conn.getautocommit():
+            conn.execute("ROLLBACK")
+        raise
+
+def _has_column(cursor, table, column):
+    """Return whether a table has the given column."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return column in [info[1] for info in cursor.fetchall()]
 
 def initialize_database():
     """Initialize the database to store services, keys, and IVs."""
-    conn = sqlite3.connect(DB_FILE)
+    # Use a separate connection so no connection is inherited by forked workers
+    conn = apsw.Connection(DB_FILE)
+    conn.setbusytimeout(BUSY_TIMEOUT_MS)
     cursor = conn.cursor()
 
+    # WAL lets readers run concurrently with the writer; the mode is persistent
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     # Create the services table if it does not exist
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS services (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             service_name TEXT NOT NULL,
-            aes_key TEXT NOT NULL,
+            aes_key BLOB NOT NULL,
             key_version INTEGER NOT NULL,
             use_fixed_iv BOOLEAN NOT NULL,
-            fixed_iv TEXT
+            fixed_iv BLOB,
+            cipher_mode TEXT NOT NULL DEFAULT 'CFB'
         )
     """)
 
-    # Commit and close connection
-    conn.commit()
+    # Add the cipher mode column to databases created before GCM support.
+    # Workers start concurrently, so re-check under the write lock before altering.
+    if not _has_column(cursor, 'services', 'cipher_mode'):
+        with write_transaction(conn):
+            if not _has_column(cursor, 'services', 'cipher_mode'):
+                cursor.execute("ALTER TABLE services ADD COLUMN cipher_mode TEXT NOT NULL DEFAULT 'CFB'")
+
+    # Convert keys and IVs stored as base64 text by older versions to raw bytes.
+    # Select under the write lock so concurrent workers never convert a row twice.
+    with write_transaction(conn):
+        cursor.execute("SELECT id, aes_key, fixed_iv FROM services WHERE typeof(aes_key) = 'text'")
+        for row_id, aes_key, fixed_iv in cursor.fetchall():
+            cursor.execute("UPDATE services SET aes_key = ?, fixed_iv = ? WHERE id = ?",
+                           (b64decode(aes_key), b64decode(fixed_iv) if fixed_iv else None, row_id))
+
+    # Older versions could write the same key version twice under concurrent
+    # requests; the unique index below cannot be built until those are removed
+    cursor.execute("""
+        SELECT service_name, key_version FROM services
+        GROUP BY service_name, key_version
+        HAVING COUNT(*) > 1
+    """)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        conn.close()
+        conflicts = ", ".join(f"'{name}' version {version}" for name, version in duplicates)
+        raise RuntimeError(
+            f"Database {DB_FILE} has duplicate key versions: {conflicts}. "
+            "Remove the duplicate rows from the services table before starting the service."
+        )
+
+    # Index the (service, version) lookup used by encrypt/decrypt and update_key.
+    # Also guarantees a key version can only exist once per service.
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_services_name_ver
+        ON services (service_name, key_version)
+    """)
+
+    # Refresh planner statistics so the index is picked for lookups
+    cursor.execute("ANALYZE")
+
     conn.close()
 
+def json_response(payload, status=200):
+    """Serialize payload to a JSON response using orjson."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def get_request_json():
+    """Parse the request body as a JSON object using orjson."""
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        raise BadRequest("Request body must be valid JSON")
+    if not isinstance(data, dict):
+        raise BadRequest("Request body must be a JSON object")
+    return data
+
+def get_key_version(data):
+    """
+    Return the key_version from a request body, defaulting to version 1.
+    Raises BadRequest unless it is an integer that fits SQLite's signed
+    64-bit INTEGER.
+    """
+    key_version = data.get('key_version', 1)
+    # bool is rejected even though it subclasses int
+    if not isinstance(key_version, int) or isinstance(key_version, bool):
+        raise BadRequest("Key version must be an integer")
+    if not SQLITE_INT_MIN <= key_version <= SQLITE_INT_MAX:
+        raise BadRequest("Key version is out of range")
+    return key_version
+
+@app.errorhandler(BadRequest)
+def handle_bad_request(e):
+    """Return malformed-request errors in the API's JSON error format."""
+    return json_response({"error": e.description}, 400)
+
+def _redis_key(service_name, key_version):
+    """Return the Redis key for a service and key version."""
+    # JSON-encode the pair so names containing ':' cannot collide
+    return b'svc:' + orjson.dumps([service_name, key_version])
+
+def _get_shared_service(service_name, key_version):
+    """Return a key version from the Redis cache, or None if it is not cached."""
+    if _redis is None:
+        return None
+    try:
+        value = _redis.get(_redis_key(service_name, key_version))
+    except redis.RedisError as e:
+        app.logger.warning("Redis key cache unavailable: %s", e)
+        return None
+    if value is None:
+        return None
+
+    # A corrupt entry must fall back to SQLite; a KeyError here would
+    # otherwise be reported to the client as a missing key version
+    try:
+        entry = orjson.loads(value)
+        aes_key = b64decode(entry['aes_key'])
+        fixed_iv = b64decode(entry['fixed_iv']) if entry['fixed_iv'] else None
+        cipher_mode = entry['cipher_mode']
+        if len(aes_key) != 32 or cipher_mode not in (CIPHER_MODE_CFB, CIPHER_MODE_GCM):
+            raise ValueError("unexpected key size or cipher mode")
+        return aes_key, entry['use_fixed_iv'], fixed_iv, cipher_mode
+    except (ValueError, KeyError, TypeError, binascii.Error) as e:
+        app.logger.warning("Ignoring invalid Redis key cache entry: %r", e)
+        return None
+
+def _set_shared_service(service_name, key_version, aes_key, use_fixed_iv, fixed_iv, cipher_mode):
+    """Store a key version in the Redis cache, if one is configured."""
+    if _redis is None:
+        return
+    value = orjson.dumps({
+        "aes_key": b64encode_as_string(aes_key),
+        "use_fixed_iv": use_fixed_iv,
+        "fixed_iv": b64encode_as_string(fixed_iv) if fixed_iv else None,
+        "cipher_mode": cipher_mode,
+    })
+    try:
+        _redis.set(_redis_key(service_name, key_version), value, ex=REDIS_KEY_TTL)
+    except redis.RedisError as e:
+        app.logger.warning("Redis key cache unavailable: %s", e)
+
+def _fetch_service(service_name, key_version):
+    """
+    Fetch the raw AES key and IV policy for a service and key version from
+    Redis (if configured), falling back to SQLite.
+    Returns a tuple of (aes_key, use_fixed_iv, fixed_iv, cipher_mode).
+    Raises KeyError if the version does not exist.
+    """
+    shared = _get_shared_service(service_name, key_version)
+    if shared is not None:
+        return shared
+
+    cursor = get_conn().cursor()
+    cursor.execute("""
+        SELECT aes_key, use_fixed_iv, fixed_iv, cipher_mode FROM services
+        WHERE service_name = ? AND key_version = ?
+    """, (service_name, key_version))
+    row = cursor.fetchone()
+
+    if not row:
+        raise KeyError((service_name, key_version))
+
+    aes_key = row[0]
+    use_fixed_iv = row[1]
+    fixed_iv = row[2]
+    cipher_mode = row[3]
+    _set_shared_service(service_name, key_version, aes_key, use_fixed_iv, fixed_iv, cipher_mode)
+    return aes_key, use_fixed_iv, fixed_iv, cipher_mode
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def _load_service(service_name, key_version):
+    """
+    Load the prepared cipher key and IV policy for a service and key version.
+    Returns a tuple of (cipher_key, use_fixed_iv, fixed_iv, cipher_mode),
+    where cipher_key is an AESGCM instance for GCM key versions and an
+    algorithms.AES instance for CFB key versions.
+    Key versions are never modified once written, so results are cached for
+    the lifetime of the process and neither cache needs invalidating.
+    Raises KeyError if the version does not exist; misses are not cached,
+    so newly created versions are picked up.
+    """
+    aes_key, use_fixed_iv, fixed_iv, cipher_mode = _fetch_service(service_name, key_version)
+
+    # Build the key object once per key version instead of once per request
+    if cipher_mode == CIPHER_MODE_GCM:
+        cipher_key = AESGCM(aes_key)
+    else:
+        cipher_key = algorithms.AES(aes_key)
+    return cipher_key, use_fixed_iv, fixed_iv, cipher_mode
+
+def _update_into(context, data, prefix=b''):
+    """
+    Run data through a CFB cipher context into one preallocated buffer,
+    after an optional prefix (the IV). Returns the buffer trimmed to the
+    prefix plus the cipher output.
+    """
+    # update_into requires block_size - 1 spare bytes, even for stream modes
+    out = bytearray(len(prefix) + len(data) + AES_BLOCK_SIZE - 1)
+    out[:len(prefix)] = prefix
+    with memoryview(out)[len(prefix):] as view:
+        size = len(prefix) + context.update_into(data, view)
+    context.finalize()  # CFB is a stream mode; finalize emits no data
+    del out[size:]
+    return out
+
+def encrypt_plaintexts(cipher_key, use_fixed_iv, fixed_iv, cipher_mode, plaintexts):
+    """
+    Encrypt a list of plaintexts (bytes) with one key version.
+    cipher_key is the prepared key from _load_service and is reused for
+    every item; each item still gets its own IV unless the key version uses
+    a fixed IV.
+    Returns the base64-encoded ciphertexts, in order.
+    """
+    ciphertexts = []
+
+    if cipher_mode == CIPHER_MODE_GCM:
+        for plaintext in plaintexts:
+            # The authentication tag is appended to the ciphertext
+            iv = generate_nonce()
+            ciphertexts.append(b64encode_as_string(iv + cipher_key.encrypt(iv, plaintext, None)))
+        return ciphertexts
+
+    for plaintext in plaintexts:
+        iv = fixed_iv if use_fixed_iv else generate_iv()
+        cipher = Cipher(cipher_key, modes.CFB(iv))
+        encryptor = cipher.encryptor()
+
+        # Embed IV with the ciphertext if not using a fixed IV
+        ciphertext = _update_into(encryptor, plaintext, prefix=b'' if use_fixed_iv else iv)
+        ciphertexts.append(b64encode_as_string(ciphertext))
+    return ciphertexts
+
+def min_ciphertext_size(use_fixed_iv, cipher_mode):
+    """Return the smallest framed ciphertext (in bytes) a key version can produce."""
+    if use_fixed_iv:
+        return 0
+    if cipher_mode == CIPHER_MODE_GCM:
+        return GCM_NONCE_SIZE + GCM_TAG_SIZE
+    return AES_BLOCK_SIZE
+
+def decrypt_ciphertext(cipher_key, use_fixed_iv, fixed_iv, cipher_mode, data):
+    """
+    Decrypt one ciphertext (raw bytes, as framed by encrypt_plaintexts)
+    with the prepared key from _load_service.
+    Returns the plaintext as a bytes-like object. Raises InvalidTag if a GCM
+    ciphertext fails authentication.
+    """
+    # Determine IV
+    if use_fixed_iv:
+        iv = fixed_iv
+        ciphertext = data
+    else:
+        iv_size = GCM_NONCE_SIZE if cipher_mode == CIPHER_MODE_GCM else AES_BLOCK_SIZE
+        iv = data[:iv_size]
+        ciphertext = memoryview(data)[iv_size:]  # Avoid copying the payload
+
+    if cipher_mode == CIPHER_MODE_GCM:
+        return cipher_key.decrypt(iv, ciphertext, None)
+
+    cipher = Cipher(cipher_key, modes.CFB(iv))
+    return _update_into(cipher.decryptor(), ciphertext)
+
 # Initialize the database
 initialize_database()
 
@@ -51,42 +437,40 @@ def create_service():
     - service_name: Name of the service.
     - use_fixed_iv: Whether to use a fixed IV (true/false).
     """
-    data = request.get_json()
+    data = get_request_json()
     service_name = data.get('service_name')
     use_fixed_iv = data.get('use_fixed_iv', False)  # Default to False
 
     if not service_name:
-        return jsonify({"error": "Service name is required"}), 400
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Check if the service already exists
-    cursor.execute("SELECT * FROM services WHERE service_name = ?", (service_name,))
-    if cursor.fetchone():
-        return jsonify({"error": "Service already exists"}), 400
+        return json_response({"error": "Service name is required"}, 400)
 
     # Generate AES key
     aes_key = generate_aes_key()
 
     # Generate fixed IV if required
-    fixed_iv = b64encode(generate_iv()).decode() if use_fixed_iv else None
+    fixed_iv = generate_iv() if use_fixed_iv else None
 
     # Default key version is 1 for the first key
     key_version = 1
 
-    # Save to database with versioning
-    cursor.execute("""
-        INSERT INTO services (service_name, aes_key, key_version, use_fixed_iv, fixed_iv)
-        VALUES (?, ?, ?, ?, ?)
-    """, (service_name, b64encode(aes_key).decode(), key_version, use_fixed_iv, fixed_iv))
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    cursor = conn.cursor()
 
-    return jsonify({
+    # Save to database with versioning.
+    # The unique (service_name, key_version) index rejects existing services.
+    try:
+        with write_transaction(conn):
+            cursor.execute("""
+                INSERT INTO services (service_name, aes_key, key_version, use_fixed_iv, fixed_iv, cipher_mode)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (service_name, aes_key, key_version, use_fixed_iv, fixed_iv, cipher_mode_for(use_fixed_iv)))
+    except apsw.ConstraintError:
+        return json_response({"error": "Service already exists"}, 400)
+
+    return json_response({
         "message": f"Service '{service_name}' created successfully",
-        "aes_key": b64encode(aes_key).decode(),
-        "fixed_iv": fixed_iv if fixed_iv else "IV will be generated per encryption"
+        "aes_key": b64encode_as_string(aes_key),
+        "fixed_iv": b64encode_as_string(fixed_iv) if fixed_iv else "IV will be generated per encryption"
     })
 
 @app.route('/<service_name>/encrypt', methods=['POST'])
@@ -94,55 +478,76 @@ def encrypt(service_name):
     """
     Encrypt data using the AES key for a service and key version.
     Parameters:
-    - plaintext: Data to encrypt.
+    - plaintext: Text to encrypt (UTF-8).
+    - plaintext_b64: Binary data to encrypt (base64-encoded), instead of plaintext.
     - key_version: The version of the AES key to use.
     """
-    data = request.get_json()
+    data = get_request_json()
     plaintext = data.get('plaintext')
-    key_version = data.get('key_version', 1)  # Default to version 1
+    plaintext_b64 = data.get('plaintext_b64')
+    key_version = get_key_version(data)
+
+    if plaintext_b64:
+        # Raw bytes go straight to the cipher, without a UTF-8 round-trip
+        if not isinstance(plaintext_b64, str):
+            return json_response({"error": "plaintext_b64 must be valid base64"}, 400)
+        try:
+            plaintext = b64decode(plaintext_b64, validate=True)
+        except (binascii.Error, ValueError):
+            return json_response({"error": "plaintext_b64 must be valid base64"}, 400)
+    elif plaintext:
+        if not isinstance(plaintext, str):
+            return json_response({"error": "Plaintext must be a string"}, 400)
+        plaintext = plaintext.encode()
+    else:
+        return json_response({"error": "Plaintext is required"}, 400)
 
-    if not plaintext:
-        return jsonify({"error": "Plaintext is required"}), 400
+    # Get the AES key and IV policy for the service and the specified key version
+    try:
+        cipher_key, use_fixed_iv, fixed_iv, cipher_mode = _load_service(service_name, key_version)
+    except KeyError:
+        return json_response({"error": f"Service with version {key_version} not found"}, 404)
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    if use_fixed_iv and not fixed_iv:
+        return json_response({"error": "Fixed IV is missing for this service version"}, 500)
 
-    # Get the AES key and IV policy for the service and the specified key version
-    cursor.execute("""
-        SELECT aes_key, use_fixed_iv, fixed_iv FROM services
-        WHERE service_name = ? AND key_version = ?
-    """, (service_name, key_version))
-    row = cursor.fetchone()
-    conn.close()
+    ciphertext = encrypt_plaintexts(cipher_key, use_fixed_iv, fixed_iv, cipher_mode, [plaintext])[0]
 
-    if not row:
-        return jsonify({"error": f"Service with version {key_version} not found"}), 404
+    return json_response({
+        "ciphertext": ciphertext
+    })
 
-    aes_key = b64decode(row[0])
-    use_fixed_iv = row[1]
-    fixed_iv = b64decode(row[2]) if row[2] else None
 
-    # Determine IV
-    if use_fixed_iv:
-        if not fixed_iv:
-            return jsonify({"error": "Fixed IV is missing for this service version"}), 500
-        iv = fixed_iv
-    else:
-        iv = generate_iv()
+@app.route('/<service_name>/encrypt_batch', methods=['POST'])
+def encrypt_batch(service_name):
+    """
+    Encrypt multiple items using the AES key for a service and key version.
+    The key is looked up and set up once for the whole batch.
+    Parameters:
+    - items: List of plaintexts to encrypt.
+    - key_version: The version of the AES key to use.
+    """
+    data = get_request_json()
+    items = data.get('items')
+    key_version = get_key_version(data)
 
-    cipher = Cipher(algorithms.AES(aes_key), modes.CFB(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    ciphertext = encryptor.update(plaintext.encode()) + encryptor.finalize()
+    if not items or not isinstance(items, list) or not all(item and isinstance(item, str) for item in items):
+        return json_response({"error": "Items must be a non-empty list of plaintexts"}, 400)
 
-    # Embed IV with the ciphertext if not using a fixed IV
-    if not use_fixed_iv:
-        combined_data = iv + ciphertext
-        ciphertext = b64encode(combined_data).decode()
-    else:
-        ciphertext = b64encode(ciphertext).decode()
+    # Get the AES key and IV policy for the service and the specified key version
+    try:
+        cipher_key, use_fixed_iv, fixed_iv, cipher_mode = _load_service(service_name, key_version)
+    except KeyError:
+        return json_response({"error": f"Service with version {key_version} not found"}, 404)
 
-    return jsonify({
-        "ciphertext": ciphertext
+    if use_fixed_iv and not fixed_iv:
+        return json_response({"error": "Fixed IV is missing for this service version"}, 500)
+
+    ciphertexts = encrypt_plaintexts(cipher_key, use_fixed_iv, fixed_iv, cipher_mode,
+                                     [item.encode() for item in items])
+
+    return json_response({
+        "ciphertexts": ciphertexts
     })
 
 
@@ -153,48 +558,50 @@ def decrypt(service_name):
     Parameters:
     - ciphertext: Data to decrypt (base64-encoded).
     - key_version: Version of the key to use for decryption.
+    - return_b64: Return the plaintext base64-encoded as plaintext_b64 (true/false).
     """
-    data = request.get_json()
+    data = get_request_json()
     ciphertext = data.get('ciphertext')
-    key_version = data.get('key_version', 1)  # Default to version 1
+    key_version = get_key_version(data)
+    return_b64 = data.get('return_b64', False)  # Default to UTF-8 text
 
     if not ciphertext:
-        return jsonify({"error": "Ciphertext is required"}), 400
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+        return json_response({"error": "Ciphertext is required"}, 400)
+    if not isinstance(ciphertext, str):
+        return json_response({"error": "Ciphertext must be valid base64"}, 400)
 
     # Get the AES key and IV policy for the service and key version
-    cursor.execute("""
-        SELECT aes_key, use_fixed_iv, fixed_iv FROM services
-        WHERE service_name = ? AND key_version = ?
-    """, (service_name, key_version))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
-        return jsonify({"error": f"Service with version {key_version} not found"}), 404
-
-    aes_key = b64decode(row[0])
-    use_fixed_iv = row[1]
-    fixed_iv = b64decode(row[2]) if row[2] else None
-
-    # Determine IV
-    if use_fixed_iv:
-        if not fixed_iv:
-            return jsonify({"error": "Fixed IV is missing for this service"}), 500
-        iv = fixed_iv
-        ciphertext = b64decode(ciphertext)
-    else:
-        combined_data = b64decode(ciphertext)
-        iv = combined_data[:16]
-        ciphertext = combined_data[16:]
-
-    cipher = Cipher(algorithms.AES(aes_key), modes.CFB(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-
-    return jsonify({"plaintext": plaintext.decode()})
+    try:
+        cipher_key, use_fixed_iv, fixed_iv, cipher_mode = _load_service(service_name, key_version)
+    except KeyError:
+        return json_response({"error": f"Service with version {key_version} not found"}, 404)
+
+    if use_fixed_iv and not fixed_iv:
+        return json_response({"error": "Fixed IV is missing for this service"}, 500)
+
+    # Strict decoding takes pybase64's SIMD path without a character-filtering pass
+    try:
+        ciphertext = b64decode(ciphertext, validate=True)
+    except (binascii.Error, ValueError):
+        return json_response({"error": "Ciphertext must be valid base64"}, 400)
+
+    # Anything shorter cannot hold the IV (and GCM tag) and would fail in the cipher
+    if len(ciphertext) < min_ciphertext_size(use_fixed_iv, cipher_mode):
+        return json_response({"error": "Ciphertext is too short"}, 400)
+
+    try:
+        plaintext = decrypt_ciphertext(cipher_key, use_fixed_iv, fixed_iv, cipher_mode, ciphertext)
+    except InvalidTag:
+        return json_response({"error": "Ciphertext failed authentication"}, 400)
+
+    if return_b64:
+        return json_response({"plaintext_b64": b64encode_as_string(plaintext)})
+    # CFB has no integrity check, so a corrupted ciphertext decrypts to garbage
+    try:
+        plaintext = plaintext.decode()
+    except UnicodeDecodeError:
+        return json_response({"error": "Plaintext is not valid UTF-8; use return_b64"}, 400)
+    return json_response({"plaintext": plaintext})
 
 
 @app.route('/<service_name>/update_key', methods=['POST'])
@@ -207,7 +614,7 @@ def update_key(service_name):
     - use_fixed_iv: Whether to use a fixed IV (true/false).
     - fixed_iv: New fixed IV (base64-encoded, required if use_fixed_iv is true).
     """
-    data = request.get_json()
+    data = get_request_json()
     use_fixed_iv = data.get('use_fixed_iv', False)
 
     # Automatically generate a new AES key
@@ -216,37 +623,34 @@ def update_key(service_name):
     if use_fixed_iv:
         # Generate a new IV and hardcode it for services using a fixed IV
         fixed_iv = generate_iv()
-        fixed_iv_base64 = b64encode(fixed_iv).decode()
     else:
         # If not using a fixed IV, don't change IV (it will be generated dynamically during encryption)
-        fixed_iv_base64 = None
+        fixed_iv = None
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_conn()
     cursor = conn.cursor()
 
-    # Check if the service exists
-    cursor.execute("SELECT * FROM services WHERE service_name = ?", (service_name,))
-    if not cursor.fetchone():
-        return jsonify({"error": "Service not found"}), 404
-
-    # Increment the key version for the update
-    cursor.execute("SELECT MAX(key_version) FROM services WHERE service_name = ?", (service_name,))
-    current_version = cursor.fetchone()[0] or 0
-    new_version = current_version + 1
-
-    # Update the service with new AES key and fixed IV (if applicable)
-    cursor.execute("""
-        INSERT INTO services (service_name, aes_key, key_version, use_fixed_iv, fixed_iv)
-        VALUES (?, ?, ?, ?, ?)
-    """, (service_name, b64encode(new_aes_key).decode(), new_version, use_fixed_iv, fixed_iv_base64))
-
-    conn.commit()
-    conn.close()
-
-    return jsonify({
+    # Insert the new AES key and fixed IV (if applicable) as the next key version.
+    # No row is inserted or returned if the service does not exist.
+    with write_transaction(conn):
+        cursor.execute("""
+            INSERT INTO services (service_name, aes_key, key_version, use_fixed_iv, fixed_iv, cipher_mode)
+            SELECT service_name, ?, MAX(key_version) + 1, ?, ?, ?
+            FROM services WHERE service_name = ?
+            GROUP BY service_name
+            RETURNING key_version
+        """, (new_aes_key, use_fixed_iv, fixed_iv, cipher_mode_for(use_fixed_iv), service_name))
+        # Fetch all rows so the statement has finished before COMMIT
+        rows = cursor.fetchall()
+    if not rows:
+        return json_response({"error": "Service not found"}, 404)
+    new_version = rows[0][0]
+
+    return json_response({
         "message": f"Service '{service_name}' updated successfully",
-        "new_aes_key": b64encode(new_aes_key).decode(),
-        "fixed_iv": fixed_iv_base64 if fixed_iv_base64 else "IV will be generated per encryption"
+        "new_aes_key": b64encode_as_string(new_aes_key),
+        "key_version": new_version,
+        "fixed_iv": b64encode_as_string(fixed_iv) if fixed_iv else "IV will be generated per encryption"
     })
 
 if __name__ == '__main__':
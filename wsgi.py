@@ -0,0 +1,6 @@
+"""
+WSGI entry point for production servers.
+Example:
+    gunicorn -w $(nproc) -k gthread --threads 4 wsgi:app
+"""
+from app import app